@@ -877,13 +877,13 @@ def get_layout(qet_project):
         cells = []
     
         for c in range(1,len(TABLE)):  # cols
-            if terminals[i]['block_name'] != memo_block_name:
+            if terminals[i].block_name != memo_block_name:
                 back_color = 1 - back_color
-                memo_block_name = terminals[i]['block_name']
+                memo_block_name = terminals[i].block_name
 
             if c == 1:  # the firs cell saves UUID
-                meta = terminals[i]['uuid']
-            text = terminals[i][TABLE[c]['key']]
+                meta = terminals[i].uuid
+            text = getattr(terminals[i], TABLE[c]['key'])
             cells += [ table_cell(c, r, text=text, metadata=meta, bgcolor = back_color) ]
 
         i += 1  # new row in the terminals from project
@@ -23,15 +23,51 @@
 import logging as log
 import operator
 import re
-import xml.etree.ElementTree as etree  # python3-lxml
-from collections import OrderedDict
-import tempfile
-import os
+from lxml import etree  # python3-lxml
+from collections import Counter, OrderedDict
+
+
+# Precompiled regex
+_RE_LOGOS = re.compile(r'(<logos>[\s\S]+<\/logos>)')  # logos section of the project
+_RE_LOGOS_EMPTY = re.compile(r'<logos\s*/>')
+_RE_XREF_TAGS = re.compile(r'%(LM|F|M|f|l|c)')  # tags of the folio reference type
+
+
+class Terminal:
+    """A terminal element used in the QET project. See QETProject for
+    the meaning of every field."""
+
+    __slots__ = ('uuid', 'block_name', 'terminal_name', 'terminal_xref',
+            'cable', 'terminal_pos', 'terminal_type', 'hose', 'conductor',
+            'bridge', 'num_reserve', 'reserve_positions', 'size')
+
+    def __init__(self, uuid, block_name, terminal_name, terminal_xref, \
+            cable, terminal_pos, terminal_type, hose, conductor, \
+            bridge, num_reserve, reserve_positions, size):
+        self.uuid = uuid
+        self.block_name = block_name
+        self.terminal_name = terminal_name
+        self.terminal_xref = terminal_xref
+        self.cable = cable
+        self.terminal_pos = terminal_pos
+        self.terminal_type = terminal_type
+        self.hose = hose
+        self.conductor = conductor
+        self.bridge = bridge
+        self.num_reserve = num_reserve
+        self.reserve_positions = reserve_positions
+        self.size = size
+
+
+    def as_dict(self):
+        """Returns the terminal as a dict with the same keys as the fields"""
+        return {k: getattr(self, k) for k in self.__slots__}
+
 
 
 class QETProject:
     """This class works with the XML source file of a QET Project.
-    The list of terminals has dicts like:
+    The list of terminals has Terminal objects like:
         {uuid, block_name, terminal_name, terminal_pos, 
         terminal_xref, terminal_type, conductor_name, cable, cable_cond} 
     where:
@@ -51,6 +87,13 @@ class QETProject:
     The tags for every key have the form %_ (are specified above)
     """
 
+    __slots__ = ('_qet_tree', 'qet_project_file', 'qet_project', \
+            'original_logo_section', '_streaming', 'folio_reference_type', \
+            '_xref_tags', '_xref_format', 'xml_version', 'pageOffset', \
+            '_totalPages', '_diagram_xref_cache', '_terminalElements', \
+            '_terminalTypes', '__used_terminals', '_block_names', \
+            '_elements_by_uuid', '_collection_elements')
+
     # class attributes
     QET_COL_ROW_SIZE = 25  # pixels offset for elements coord
     QET_BLOCK_TERMINAL_SIZE = 30  # pixels offset for elements coord
@@ -58,7 +101,7 @@ class QETProject:
 
 
     def __init__(self, project_file, fromPage='', \
-            toPage = '', searchImplicitsConnections = False):
+            toPage = '', searchImplicitsConnections = False, streaming = False):
         """class initializer. Parses the QET XML file.
         @param project_file: file of the QET project
         @param folio_reference_type: how to calc XRefs when recover project info:
@@ -66,7 +109,10 @@ class QETProject:
            'D' default (%f-%l%c) i.e. 15-F4
         @param fromPage: first page in range to be processed
         @param toPage: last page in range to be processed
-        @param searchImplicitsConnections: True for search implicit connections in TB creation"""
+        @param searchImplicitsConnections: True for search implicit connections in TB creation
+        @param streaming: True for only reading the terminals. The pages are
+            parsed one by one and freed, so the project can't be modified
+            or saved (update_terminals, insert_tb, save_tb)"""
 
         # Defines namespaces if exists. When changes the project logo in QET appears ns
         # but are not defined in the head, like:  xmlns:ns0="ns0".
@@ -90,23 +136,14 @@ class QETProject:
         #         with open(project_file, 'w' ,encoding='utf8') as f:
         #             f.write(xml)
         
-        # Creates a copy of original project because of the LOGO section usually has not defined namespaces
-        # and etree launches an error
-        regex_logos = '(<logos>[\s\S]+<\/logos>)'
-        with open(project_file, 'r' ,encoding='utf8') as f:
-            xml = f.read()
-            logo = re.findall( regex_logos, xml )  # namesapaces
-        if logo:
-            self.original_logo_section = logo
-            xml = re.sub(regex_logos, '<logos />', xml, 1)  #replaces first ocurrence
-        else:
-            self.original_logo_section = ''
-        tmpf = tempfile.NamedTemporaryFile(mode='w', encoding='utf8', delete=False)
-        tmpf.write(xml)
-        log.info ("Generate temp file {}".format(tmpf.name))
+        self._streaming = streaming
+        self.original_logo_section = ''
 
         # starting...
-        self._qet_tree = etree.parse(tmpf.name)
+        if streaming:
+            self._qet_tree = self._parseSkeleton(project_file)
+        else:
+            self._qet_tree = self._parse(project_file)
         self.qet_project_file = project_file
         self.qet_project = self._qet_tree.getroot()
         
@@ -114,6 +151,11 @@ class QETProject:
         self.folio_reference_type = self.qet_project.find('.//newdiagrams'). \
                 find('report').attrib['label']
 
+        # xref format as a python format string, i.e. '%f-%l%c' ==> '{f}-{l}{c}'
+        ref = self.folio_reference_type.replace('{', '{{').replace('}', '}}')
+        self._xref_tags = set(_RE_XREF_TAGS.findall(ref))
+        self._xref_format = _RE_XREF_TAGS.sub(r'{\1}', ref)
+
         # XML version
         self.xml_version = self.qet_project.attrib['version']
 
@@ -128,19 +170,108 @@ class QETProject:
             
 
         # general project info
-        self._totalPages = len (self.qet_project.findall('.//diagram')) + \
+        # iter() walks the tree natively. Path expressions like './/diagram'
+        # go through the path interpreter, that is slower.
+        self._totalPages = sum(1 for _ in self.qet_project.iter('diagram')) + \
                 self.pageOffset
 
+        # xref data of every page. See _getDiagramParams
+        self._diagram_xref_cache = {}
+
         # elements type of terminal
         self._terminalElements = self._getListOfElementsByType( 'terminal' )
+        self._terminalTypes = tuple(self._terminalElements)  # for str.endswith
+
+        # finds all terminals. A list of Terminal
+        if streaming:
+            self._set_used_terminals(self._iterStreamedDiagrams(project_file))
+        else:
+            self._set_used_terminals()
+            self._set_indexes()
 
-        # finds all terminals. A list of dicts
-        self._set_used_terminals()
 
-        #deleting temp file
-        tmpf.close()
-        os.unlink(tmpf.name)
-        log.info ("Deleted temp file {}".format(tmpf.name))
+
+    def _parse(self, project_file):
+        """Parses the full QET XML file.
+        @param project_file: file of the QET project
+        @return: the etree of the project"""
+
+        with open(project_file, 'r' ,encoding='utf8') as f:
+            xml = f.read()
+        parser = etree.XMLParser(huge_tree=True, remove_blank_text=False)
+
+        try:
+            return etree.fromstring(xml.encode('utf-8'), parser).getroottree()
+        except etree.ParseError:
+            # Parses a copy of original project without the LOGO section because
+            # usually has not defined namespaces and etree launches an error
+            log.info ("Project not well-formed. Parsing again without logos")
+            logo = _RE_LOGOS.findall( xml )  # namesapaces
+            if logo:
+                self.original_logo_section = logo
+                xml = _RE_LOGOS.sub('<logos />', xml, 1)  #replaces first ocurrence
+            return etree.fromstring(xml.encode('utf-8'), parser).getroottree()
+
+
+    def _parseSkeleton(self, project_file):
+        """Parses the QET XML file emptying the pages (diagrams) as soon as
+        they are read. Keeps the project info and the collection with
+        low memory use. The pages are read later by _iterStreamedDiagrams.
+        The parser recovers from the not defined namespaces of the logos.
+        @param project_file: file of the QET project
+        @return: the etree of the project with empty diagrams"""
+
+        context = etree.iterparse(project_file, events=('end',), tag='diagram', \
+                huge_tree=True, recover=True)
+        for _, diagram in context:
+            if diagram.getparent().getparent() is None:  # a page of the project
+                diagram.clear()
+        return context.root.getroottree()
+
+
+    def _iterStreamedDiagrams(self, project_file):
+        """Parses the QET XML file again and yields the pages (diagrams)
+        one by one. Every page is freed after processing it.
+        @param project_file: file of the QET project
+        @return: generator of diagrams XML etree objects"""
+
+        context = etree.iterparse(project_file, events=('end',), tag='diagram', \
+                huge_tree=True, recover=True)
+        for _, diagram in context:
+            if diagram.getparent().getparent() is not None:  # not a page
+                continue
+            yield diagram
+
+            # frees the page (and the previous ones)
+            self._diagram_xref_cache.pop(diagram, None)
+            diagram.clear()
+            while diagram.getprevious() is not None:
+                del diagram.getparent()[0]
+
+
+    def _set_indexes(self):
+        """Indexes the elements modified by update_terminals and insert_tb:
+          - _elements_by_uuid: {uuid: element} of the elements in the pages.
+          - _collection_elements: {name: element} of the elements in the
+            imported collection (where the terminal blocks are saved)."""
+
+        self._elements_by_uuid = {}
+        for diagram in self.qet_project.findall('diagram'):  # all diagrams(pages)
+            for element in diagram.iter('element'):  # all elements in diagram
+                if 'uuid' in element.attrib:
+                    self._elements_by_uuid[element.attrib['uuid']] = element
+
+        self._collection_elements = {}
+        father = self.qet_project.find('collection').find('category')
+        if father is not None:
+            for element in father.iter('element'):  # all elements in the imported collection
+                self._collection_elements[element.attrib['name']] = element
+
+
+    def _checkNotStreaming(self):
+        """The tree of a project read in streaming mode is incomplete"""
+        if self._streaming:
+            raise RuntimeError('QET project read in streaming mode. It can not be modified')
 
 
 
@@ -170,7 +301,7 @@ class QETProject:
         return: name of terminal"""
 
         dt = element.find('dynamic_texts')
-        if dt:
+        if dt is not None:
             for d in dt.findall('dynamic_elmt_text'):
                 if d.attrib['text_from'] == 'ElementInfo':
                     return d.findtext('text')
@@ -178,7 +309,7 @@ class QETProject:
         ## old version of QET XML diagram doesn't have dynamic text.
         label = formula = ''
         elinfos = element.find('elementInformations')
-        if elinfos:
+        if elinfos is not None:
             for t in elinfos.findall('elementInformation'):
                 if t.attrib['name'] == 'label':
                     label = t.text
@@ -198,96 +329,102 @@ class QETProject:
         All the info is Function field under 'elementInformation'
         return: {} with the content of every key"""
 
-        meta = ''
         ret = {}
     
         ## Get meta string
-        for t in element.find('elementInformations').findall('elementInformation'):
-            if t.attrib['name'] == 'function':
-                meta = t.text
-                break
+        info = element.find("elementInformations/elementInformation[@name='function']")
+        meta = info.text if info is not None and info.text else ''
         
-        ## Getting data
-        if meta is None:
-            meta = ''
-        foo  = re.search(r'%p(\d+)(%|$)', meta)  # %p
-        ret['terminal_pos'] = foo.group(1) if foo else ''
-
-        foo = re.search(r'%t([^%]*)(%|$)', meta)  # %t
-        tp = ''
-        if foo: tp = foo.group(1)
-        ret['terminal_type'] = foo.group(1) if tp!='' else 'STANDARD'
-    
-        foo  = re.search(r'%h([^%]*)(%|$)', meta)  # %h. Conductor of a hose
-        ret['hose'] = foo.group(1) if foo else ''
-
-        foo  = re.search(r'%n([^%]*)(%|$)', meta)  # %n . Cable Hose
-        ret['conductor'] = foo.group(1) if foo else ''
-                
-        foo  = re.search(r'%b([^%]*)(%|$)', meta)  # %b
-        ret['bridge'] = foo.group(1) if foo else ''
-
-        foo = re.search(r'%r(\d+)(%|$)', meta)  # %r
-        tp = ''
-        if foo: tp = foo.group(1)
-        ret['num_reserve'] = foo.group(1) if tp != '' else 0
-
-        foo = re.search(r'%z([^%]*)(%|$)', meta)  # %z
-        ret['reserve_positions'] = foo.group(1) if foo else ''
-
-        foo = re.search(r'%s(\d+)(%|$)', meta)  # %s (terminals per terminal block)
-        tp = ''
-        if foo: tp = foo.group(1)
-        ret['size'] = foo.group(1) if tp != '' else QETProject.QET_BLOCK_TERMINAL_SIZE
+        ## Getting data. Tokens are '%<key letter><value>': {key letter: value}
+        ## The text before the first '%' is not a token.
+        d = {}
+        tokens = meta.split('%')[1:]
+        for i, t in enumerate(tokens):
+            if t and t[0] not in d:  # first valid ocurrence wins
+                v = t[1:]
+                if t[0] in 'prs':  # %p, %r and %s only accept digits
+                    if i == len(tokens) - 1 and v.endswith('\n'):
+                        v = v[:-1]  # as '$' in a regex, before a final newline
+                    if not v.isdecimal():
+                        continue
+                d[t[0]] = v
+
+        ret['terminal_pos'] = d.get('p', '')
+        ret['terminal_type'] = d.get('t') or 'STANDARD'
+        ret['hose'] = d.get('h', '')  # Conductor of a hose
+        ret['conductor'] = d.get('n', '')  # Cable Hose
+        ret['bridge'] = d.get('b', '')
+        ret['num_reserve'] = d.get('r', 0)
+        ret['reserve_positions'] = d.get('z', '')
+        ret['size'] = d.get('s', QETProject.QET_BLOCK_TERMINAL_SIZE)  # terminals per terminal block
 
         return ret
 
 
-    def _isValidTerminal (self, element):
+    def _isValidTerminal (self, element, name=None):
         """ An element is valid if type is 'terminal' and label is like 'X1:1'
         @param element:  element  (XML etree object)
+        @param name: name of the element if already known. Avoids a new
+            search of the name in the element.
         @return: True / False"""
         
-        tmp = self._getElementName(element).strip()  #kk 
-        if re.search(r'^(.+):(.+)$', self._getElementName(element).strip()):
+        if name is None:
+            name = self._getElementName(element).strip()
+        if ':' in name[1:-1] and '\n' not in name:  # like 'X1:1'
             if 'type' in element.attrib:  # elements must have a 'type'
-                for el in self._terminalElements:  # searching type
-                    if re.search(el + '$', element.attrib['type']):
-                        return True
+                if element.attrib['type'].endswith(self._terminalTypes):  # searching type
+                    return True
         
         return False
 
 
 
-    def _getCableNum(self, diagram, terminalId, terminalUUID):
-        """Return the cable number connected at 'terminalId' in the page 'diagram'
+    def _getCablesIndex(self, diagram):
+        """Return the cable numbers of the page 'diagram' indexed for searching.
+        Only the first conductor found for every key is saved, as the
+        search of _getCableNum is in the conductors order.
+
+        @param diagram: diagram(page) XML etree object
+        @return: ({element UUID: cable num}, {terminalId: cable num})"""
+
+        by_element = {}
+        by_terminal = {}
+        conductors = diagram.find('conductors')
+        if conductors is None:
+            return (by_element, by_terminal)
+
+        for cable in conductors.findall('conductor'):
+            num = cable.attrib.get('num', '')
+            for k, v in cable.attrib.items():
+                if k[:7] == 'element':
+                    by_element.setdefault(v, num)
+                elif k[:8] == 'terminal':
+                    by_terminal.setdefault(v, num)
+        return (by_element, by_terminal)
+
+
+    def _getCableNum(self, cables, terminalId, terminalUUID):
+        """Return the cable number connected at 'terminalId' in a page
 
         New in v1.2.6: To search for the cable num:
           - Start searching the Terminal's UUID in the 'element1' and 'element2' of conductors.
           - if not found, search for terminalId in the 'terminal1' and 'terminal2' of conductors
 
-        @param terminalUUID: the UUID of the Terminal Element
-        @param diagram: diagram(page) XML etree object
+        @param cables: index of the cables of the page. See _getCablesIndex
         @param terminalId: text with the terminal Id of the Terminal Element
+        @param terminalUUID: the UUID of the Terminal Element
         @return: string whith cable  number"""
 
-        ret = ''
-        log.debug ("Getting cable number connected to terminal {} at page {} of element {}".format ( \
-            terminalId, diagram.attrib['title'], terminalUUID))
+        log.debug ("Getting cable number connected to terminal {} of element {}".format ( \
+            terminalId, terminalUUID))
 
+        by_element, by_terminal = cables
         # Search for the UUID in the conductors element1 and element2. New in v1.2.6
-        for cable in diagram.find('conductors').findall('conductor'):
-            for cable_element in [x for x in cable.attrib if x[:7] == 'element' ]:
-                if cable.attrib[cable_element] == terminalUUID:
-                    return cable.attrib['num']
+        if terminalUUID in by_element:
+            return by_element[terminalUUID]
 
         # Search for the terminalid of the Terminal Element in the conductor atributes.
-        for cable in diagram.find('conductors').findall('conductor'):
-            for cable_terminal in \
-                    [x for x in cable.attrib if x[:8] == 'terminal' ]:
-                if cable.attrib[cable_terminal] == terminalId:
-                    return cable.attrib['num']
-        return ret
+        return by_terminal.get(terminalId, '')
 
 
     
@@ -303,18 +440,16 @@ class QETProject:
                Useful for Xref for the terminal of an element
         @param offset_y: correction of the coord y
         @return: string like "p-rc" (page - rowLetter colNumber)"""
-        ret = self.folio_reference_type
 
         # get coord
         element_x = int(float(element.attrib['x'])) + int(float(offset_x))
         element_y = int(float(element.attrib['y'])) + int(float(offset_y))
         row, col = self._getXRefByCoord (diagram, element_x, element_y)
-        diagram_page = str(int(diagram.attrib['order']) + self.pageOffset)
+        diagram_page = self._getDiagramParams(diagram)[5]
 
-        # Change tags to real value
-        if '%f' in ret:
-            ret = ret.replace('%f', diagram_page)
-        if '%F' in ret:
+        # Real value of the tags
+        tags = {'f': diagram_page, 'l': row, 'c': col}
+        if 'F' in self._xref_tags:
             # %F could include extra tags
             folio_label = diagram.attrib['folio']
             if '%id' in folio_label:
@@ -323,17 +458,13 @@ class QETProject:
                 folio_label = folio_label.replace('%total', str(self._totalPages))
             if '%autonum' in folio_label:
                 folio_label = folio_label.replace('%autonum', diagram_page)
-            ret = ret.replace('%F', folio_label)
-        if '%M' in ret:
-            ret = ret.replace('%M', self._getDiagramAttribute(diagram,'machine'))
-        if '%LM' in ret:
-            ret = ret.replace('%LM', self._getDiagramAttribute(diagram, 'locmach'))
-        if '%l' in ret:
-            ret = ret.replace('%l', row)
-        if '%c' in ret:
-            ret = ret.replace('%c', col)
+            tags['F'] = folio_label
+        if 'M' in self._xref_tags:
+            tags['M'] = self._getDiagramAttribute(diagram,'machine')
+        if 'LM' in self._xref_tags:
+            tags['LM'] = self._getDiagramAttribute(diagram, 'locmach')
 
-        return ret
+        return self._xref_format.format_map(tags)
 
 
     def _getDiagramAttribute(self, diagram, sAttrib):
@@ -349,6 +480,28 @@ class QETProject:
             return ''
 
 
+    def _getDiagramParams(self, diagram):
+        """Return the data of the page 'diagram' needed to calc xrefs.
+        Memorized by diagram because every terminal of the page needs them.
+
+        @param diagram: diagram(page) XML etree object
+        @return: (cols, col_size, rows, row_size, rows_letters, diagram_page)"""
+
+        # the diagram itself is the key: keeps alive the lxml proxy, so
+        # it can't be reused for other page.
+        params = self._diagram_xref_cache.get(diagram)
+        if params is None:
+            rows = int(diagram.attrib['rows'])
+            params = (int(diagram.attrib['cols']), \
+                    int(diagram.attrib['colsize']), \
+                    rows, \
+                    int(diagram.attrib['rowsize']), \
+                    ''.join([chr(x + 65) for x in range(rows)]), \
+                    str(int(diagram.attrib['order']) + self.pageOffset))
+            self._diagram_xref_cache[diagram] = params
+        return params
+
+
     def _getXRefByCoord(self, diagram, x, y):
         """Return a string with the xreference for the coordinates at page 'diagam'
         The page number incremented in one if there are a "index" page
@@ -358,21 +511,19 @@ class QETProject:
         @return: string like "p-rc" (page - rowLetter colNumber)"""
 
         # get requiered data
-        cols = int(diagram.attrib['cols'])
-        col_size = int(diagram.attrib['colsize'])
-        rows = int(diagram.attrib['rows'])
-        row_size = int(diagram.attrib['rowsize'])
+        cols, col_size, rows, row_size, rows_letters, _ = \
+                self._getDiagramParams(diagram)
         element_x = int(x)
         element_y = int(y)
-        rows_letters = [chr(x + 65) for x in range(rows)]
 
         log.debug( 'Cols: {}\tCol size: {}\tRow size: {}\tX position: {}\tY Position: {}'. \
                 format (cols, col_size, row_size, element_x, element_y))
 
+        COL_ROW = QETProject.QET_COL_ROW_SIZE
         row_letter = rows_letters[ int(
-                (element_y - QETProject.QET_COL_ROW_SIZE) / row_size) - 1 + 1]
+                (element_y - COL_ROW) / row_size) - 1 + 1]
                 # +1: cal calc. -1 index of lists start 0.
-        column = str(int((element_x - QETProject.QET_COL_ROW_SIZE) / col_size) + 1)
+        column = str(int((element_x - COL_ROW) / col_size) + 1)
         return (row_letter, column)
 
 
@@ -382,124 +533,148 @@ class QETProject:
 
 
 
-    def _set_used_terminals(self):
+    def _set_used_terminals(self, diagrams=None):
         """Creates a list of all terminal elements used in the qet project.
-        List where every element is a dict. See class info.
+        List where every element is a Terminal. See class info.
         Sorted by Block_name and terminal_pos
+        @param diagrams: iterable of the pages to process. All of the
+            project tree if None.
         """
 
         ret = []
+        if diagrams is None:
+            diagrams = self.qet_project.findall('diagram')
+
+        # local names for the methods used in the loop
+        name_of = self._getElementName
+        isvalid = self._isValidTerminal
+        meta_of = self._getElementMetadata
+        cable_of = self._getCableNum
+        xref_of = self._getXRef
 
         # first search for elements of type 'terminal' and its conductors.
-        for diagram in self.qet_project.findall('diagram'):  # all diagrams
-            for element in diagram.findall('.//element'):  # all elements in diagram
-                el = {}
+        for diagram in diagrams:  # all diagrams
+            cables = self._getCablesIndex(diagram)
+            for element in diagram.iter('element'):  # all elements in diagram
+                terminalName = name_of(element).strip()
 
-                if self._isValidTerminal(element):
+                if isvalid(element, terminalName):
 
-                    terminalName = self._getElementName(element).strip()
-                    meta_data = self._getElementMetadata (element)
+                    meta_data = meta_of (element)
                     
                     terminals = element.find('terminals').findall( 'terminal' )
                     terminalId = terminals[0].attrib['id']
-                    cableNum = self._getCableNum(diagram, terminalId, element.attrib['uuid'])
+                    cableNum = cable_of(cables, terminalId, element.attrib['uuid'])
                     try:
                         terminalId2 = terminals[1].attrib['id']
-                        cableNum2 = self._getCableNum(diagram, terminalId2, element.attrib['uuid'])
+                        cableNum2 = cable_of(cables, terminalId2, element.attrib['uuid'])
                         if cableNum == '': cableNum = cableNum2
                     except:
                         pass
-                    el['uuid'] = element.attrib['uuid']
-                    el['block_name'] = terminalName.split(':')[0]
-                    el['terminal_name'] = terminalName.split(':')[1]
-                    el['terminal_xref'] = self._getXRef(diagram, element)
-                    el['cable'] = cableNum             
+                    block_name, _, terminal_name = terminalName.partition(':')
+                    terminal_name = terminal_name.partition(':')[0]
                     if meta_data['terminal_pos']=='':  #  convert to integer for more initial intelligent sorting
                         try:
-                            el['terminal_pos'] = int(el['terminal_name']) 
+                            terminal_pos = int(terminal_name)
                         except:
-                            el['terminal_pos'] = 1
+                            terminal_pos = 1
                     else:
-                        el['terminal_pos'] = int(meta_data['terminal_pos'])
-                    el['terminal_type'] = meta_data['terminal_type']
-                    el['hose'] = meta_data['hose']
-                    el['conductor'] = meta_data['conductor']
-                    el['bridge'] = meta_data['bridge']
-                    el['num_reserve'] = meta_data['num_reserve']
-                    el['reserve_positions'] = meta_data['reserve_positions']
-                    el['size'] = meta_data['size']
-                if el: ret.append(el)
+                        terminal_pos = int(meta_data['terminal_pos'])
+                    ret.append(Terminal(
+                            uuid=element.attrib['uuid'],
+                            block_name=block_name,
+                            terminal_name=terminal_name,
+                            terminal_xref=xref_of(diagram, element),
+                            cable=cableNum,
+                            terminal_pos=terminal_pos,
+                            terminal_type=meta_data['terminal_type'],
+                            hose=meta_data['hose'],
+                            conductor=meta_data['conductor'],
+                            bridge=meta_data['bridge'],
+                            num_reserve=meta_data['num_reserve'],
+                            reserve_positions=meta_data['reserve_positions'],
+                            size=meta_data['size']))
         
         # SQL = ORDER BY block_name DESC, terminal_pos ASC
-        ret.sort(key=operator.itemgetter('terminal_pos'))
-        ret.sort(key=operator.itemgetter('block_name'), reverse=True)
-
-        #Renum. position field from 1 by one-to-one
-        memo_tb = ''; i = 1
+        # Grouping by block_name only leaves small sorts by terminal_pos.
+        blocks = {}
         for t in ret:
-            if t['block_name'] != memo_tb:
-                i=1
-            t['terminal_pos'] = i
-            memo_tb = t['block_name']
-            i +=1
+            blocks.setdefault(t.block_name, []).append(t)
+
+        ret = []
+        for block_name in sorted(blocks, reverse=True):
+            tb = sorted(blocks[block_name], key=operator.attrgetter('terminal_pos'))
+
+            #Renum. position field from 1 by one-to-one
+            for i, t in enumerate(tb, 1):
+                t.terminal_pos = i
+            ret.extend(tb)
 
         self.__used_terminals = ret
+        self._block_names = [t.block_name for t in ret]  # same order as terminals
 
 
     def get_max_tb_length(self):
         """
-        Returns the lenth of terminal-block with more terminals
+        Returns the lenth of terminal-block with more terminals.
+        0 if there are no terminals in the project.
         """
-        t = [ x['block_name'] for x in self.__used_terminals]
-        ocurrences = [t.count(i) for i in t]
-        return max(ocurrences)
+        ocurrences = Counter(self._block_names)
+        return max(ocurrences.values()) if ocurrences else 0
 
     def update_terminals(self, data):
         """Changes the config of every terminal in the diagra. The changes made 
         in the plugin will be save in the 'elementInformation' of every
-        terminal."""
-        for diagram in self.qet_project.findall('diagram'):  # all diagrams(pages)
-            for element in diagram.iter('element'):  # all elements in diagram
-                dt = [x for x in data if x['uuid'] == element.attrib['uuid']]
-                if dt:
-                    found = False
-                    # value = r'%p{}%t{}%h{}%n{}%b{}%r{}%z{}%s{}'.format(
-                    #         dt[0]['terminal_pos'], \
-                    #         dt[0]['terminal_type'], \
-                    #         dt[0]['hose'], \
-                    #         dt[0]['conductor'], \
-                    #         dt[0]['bridge'], \
-                    #         dt[0]['num_reserve'], \
-                    #         dt[0]['reserve_positions'], \
-                    #         dt[0]['size'] )
-                    value = r'%p{}%t{}%h{}%n{}%b{}%'.format(
-                            dt[0]['terminal_pos'], \
-                            dt[0]['terminal_type'], \
-                            dt[0]['hose'], \
-                            dt[0]['conductor'], \
-                            dt[0]['bridge'] )
-                    for elinfo in element.iter('elementInformation'):
-                        if elinfo.attrib['name'] == 'function':
-                            elinfo.text = value
-                            found = True
-                    if not found:  # crete a new child
-                        #~ print ('----------------------- {}'.format(element.attrib['uuid']))
-                        father = element.find('elementInformations')
-                        new = etree.SubElement(father, \
-                                'elementInformation',
-                                name="function", \
-                                show="0")
-                        new.text = value
+        terminal.
+        @param data: list of dicts with the terminals edited in the plugin,
+            with the same keys as the Terminal fields."""
+        self._checkNotStreaming()
+        by_uuid = {}  # {uuid: terminal}. The first terminal wins
+        for x in data:
+            by_uuid.setdefault(x['uuid'], x)
+
+        for uuid, dt in by_uuid.items():
+            element = self._elements_by_uuid.get(uuid)
+            if element is None:
+                continue
+
+            # value = r'%p{}%t{}%h{}%n{}%b{}%r{}%z{}%s{}'.format(
+            #         dt['terminal_pos'], \
+            #         dt['terminal_type'], \
+            #         dt['hose'], \
+            #         dt['conductor'], \
+            #         dt['bridge'], \
+            #         dt['num_reserve'], \
+            #         dt['reserve_positions'], \
+            #         dt['size'] )
+            value = ''.join(( \
+                    '%p', str(dt['terminal_pos']), \
+                    '%t', str(dt['terminal_type']), \
+                    '%h', str(dt['hose']), \
+                    '%n', str(dt['conductor']), \
+                    '%b', str(dt['bridge']), '%' ))
+            elinfo = element.find("elementInformations/elementInformation[@name='function']")
+            if elinfo is not None:
+                elinfo.text = value
+            else:  # crete a new child
+                #~ print ('----------------------- {}'.format(element.attrib['uuid']))
+                father = element.find('elementInformations')
+                new = etree.SubElement(father, \
+                        'elementInformation',
+                        name="function", \
+                        show="0")
+                new.text = value
 
 
     def save_tb(self, filename):
-        self._qet_tree.write(filename)  #, pretty_print=True)
+        self._checkNotStreaming()
+        self._qet_tree.write(filename, xml_declaration=True, encoding='utf-8')
 
         # replace temporal empty logo with the original
         if self.original_logo_section:
             with open(filename, 'r' ,encoding='utf8') as f:
                 xml = f.read()
-            new_xml = re.sub('<logos />', self.original_logo_section[0], xml, 1)  #replaces first ocurrence
+            new_xml = _RE_LOGOS_EMPTY.sub(self.original_logo_section[0], xml, 1)  #replaces first ocurrence
             with open(filename, 'w' ,encoding='utf8') as f:
                 f.write(new_xml)
 
@@ -512,24 +687,25 @@ class QETProject:
         @param tb_node: xml tree of the terminal block.
         @return: none"""
         
+        self._checkNotStreaming()
         element_name_to_delete = 'TB_' + name + '.elmt'
         father = self.qet_project.find('collection').find('category')
         
         # remove the old element
-        for element in father.iter('element'):  # all elements in the imported collection
-            if element.attrib['name'] == element_name_to_delete:
-                father.remove(element)
+        old = self._collection_elements.pop(element_name_to_delete, None)
+        if old is not None:
+            old.getparent().remove(old)
 
         # adding the element
         father.insert(0, tb_node)
+        self._collection_elements[tb_node.attrib['name']] = tb_node
     
 
     def _get_tb_names(self):
         """
         Get a list of the terminal-block names sorted
         """
-        sort_key = [x['block_name'] for x in self.__used_terminals]
-        return list(OrderedDict.fromkeys(sort_key)) 
+        return list(OrderedDict.fromkeys(self._block_names))
   
     
     # properties
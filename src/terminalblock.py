@@ -22,8 +22,57 @@
 # Imports
 import logging as log
 import re
-import xml.etree.ElementTree as etree  # python3-lxml
-import uuid as uuidly
+from collections import OrderedDict
+from itertools import groupby
+from lxml import etree  # python3-lxml
+from uuid import uuid4
+from xml.sax.saxutils import escape
+
+
+# XML templates of the primitives of the terminal block drawing.
+# The description is rendered as text and parsed only once.
+LINE_TMPL = '<line x1="{x1}" x2="{x2}" y1="{y1}" y2="{y2}" length1="1.5" ' \
+        'length2="1.5" end1="none" end2="none" antialias="false" style="{style}"/>'
+RECT_TMPL = '<rect x="{x}" y="{y}" width="{width}" height="{height}" ' \
+        'antialias="false" style="{style}"/>'
+CIRCLE_TMPL = '<circle x="{x}" y="{y}" diameter="{diameter}" ' \
+        'antialias="false" style="{style}"/>'
+TERMINAL_TMPL = '<terminal x="{x}" y="{y}" orientation="{orientation}"/>'
+DYNAMIC_TEXT_TMPL = '<dynamic_text x="{x}" y="{y}" z="3" text_from="UserText" ' \
+        'uuid="{uuid}" font_size="{size}" frame="false" rotation="270">' \
+        '<text>{text}</text>{color}</dynamic_text>'
+COLOR_TMPL = '<color>{}</color>'
+NAMES_TMPL = '<names>{}</names>'
+NAME_TMPL = '<name lang="{lang}">{text}</name>'
+ELEMENT_NAMES = ( \
+        ('de', 'Terminalblock '), \
+        ('ru', 'Терминальный блок '), \
+        ('pt', 'Bloco terminal '), \
+        ('en', 'Terminal block '), \
+        ('it', 'Terminal block '), \
+        ('fr', 'Bornier '), \
+        ('pl', 'Blok zacisków '), \
+        ('es', 'Bornero '), \
+        ('nl', 'Eindblok '), \
+        ('cs', 'Terminálový blok '))
+STROKE_STYLE = 'line-style:normal;line-weight:normal;filling:none;color:black'
+
+# Fixed attributes of the element nodes that are still built with SubElement
+DEFINITION_ATTRIB = {'hotspot_x': '5', 'hotspot_y': '24', \
+        'link_type': 'simple', 'orientation': 'dyyy', 'version': '0.4', \
+        'type': 'element'}
+ELEMENT_LABEL_ATTRIB = {'z': '2', 'text_from': 'ElementInfo', \
+        'text_width': '-1', 'font_size': '10', 'frame': 'false'}
+
+# Last terminal blocks drawn, as serialized xml. See TerminalBlock._cache_key
+_TB_CACHE = OrderedDict()
+_TB_CACHE_SIZE = 32
+
+
+def _half(value):
+    """Returns the half of value. Integer if it's possible, to write
+    '10' instead of '10.0' in the xml."""
+    return value // 2 if value % 2 == 0 else value / 2
 
 
 class TerminalBlock:
@@ -34,6 +83,7 @@ class TerminalBlock:
     """
 
     LOGO_HEIGHT = 36  #  the height of the FUSE LOGO for fuse type
+    LOGO_HEIGHT_HALF = LOGO_HEIGHT // 2
     Y_OFFSET_BASE_TEXT = 22  # vertical offset between terminal and letters
     X_OFFSET_CABLE_TEXT = 4  # horizontal offset between cable and its name
 
@@ -48,25 +98,41 @@ class TerminalBlock:
         self.terminals = collec
         self.num_terminals = len(self.terminals)
         self.tb_id = self.terminals[0]['block_name']
+
+        # one list per field. The draw loop reads them by index
+        self.t_name = [t['terminal_name'] for t in collec]
+        self.t_xref = [t['terminal_xref'] for t in collec]
+        self.t_type = [t['terminal_type'] for t in collec]
+        self.t_cable = [t['cable'] for t in collec]
+        self.t_hose = [t['hose'] for t in collec]
+        self.t_conductor = [t['conductor'] for t in collec]
+        self.t_bridge = [t['bridge'] for t in collec]
         
         # set settings if defined or defaults
-        self.HEAD_HEIGHT = [int( settings['-CFG_A-'] ), 120][settings=={}]
-        self.HEAD_WIDTH = [int( settings['-CFG_B-'] ), 44][settings=={}]
-        self.UNION_HEIGHT = [int( settings['-CFG_C-'] ), 70][settings=={}]
-        self.UNION_WIDTH = [int( settings['-CFG_D-'] ), 6][settings=={}]
-        self.TERMINAL_HEIGHT = [int( settings['-CFG_E-'] ), 160][settings=={}]
-        self.TERMINAL_WIDTH = [int( settings['-CFG_F-'] ), 20][settings=={}]
-        self.CONDUCTOR_LENGTH = [int( settings['-CFG_G-'] ), 70][settings=={}]
-        self.HOSE_CONDUCTOR_START = [int( settings['-CFG_H-'] ), 70][settings=={}]
-        self.HOSE_LENGTH = [int( settings['-CFG_I-'] ), 80][settings=={}]
-        self.HOSE_CONDUCTOR_END = [int( settings['-CFG_J-'] ), 70][settings=={}]
+        self.HEAD_HEIGHT = int(settings.get('-CFG_A-', 120))
+        self.HEAD_WIDTH = int(settings.get('-CFG_B-', 44))
+        self.UNION_HEIGHT = int(settings.get('-CFG_C-', 70))
+        self.UNION_WIDTH = int(settings.get('-CFG_D-', 6))
+        self.TERMINAL_HEIGHT = int(settings.get('-CFG_E-', 160))
+        self.TERMINAL_WIDTH = int(settings.get('-CFG_F-', 20))
+        self.CONDUCTOR_LENGTH = int(settings.get('-CFG_G-', 70))
+        self.HOSE_CONDUCTOR_START = int(settings.get('-CFG_H-', 70))
+        self.HOSE_LENGTH = int(settings.get('-CFG_I-', 80))
+        self.HOSE_CONDUCTOR_END = int(settings.get('-CFG_J-', 70))
+
+        self.HEAD_FONT = int(settings.get('-CFG_HEAD_FONT-', 13))
+        self.TERMINAL_FONT = int(settings.get('-CFG_TERMINAL_FONT-', 9))
+        self.XREF_FONT = int(settings.get('-CFG_XREF_FONT-', 6))
+        self.CONDUCTOR_FONT = int(settings.get('-CFG_CONDUCTOR_FONT-', 6))
 
-        self.HEAD_FONT = [int( settings['-CFG_HEAD_FONT-'] ), 13][settings=={}]
-        self.TERMINAL_FONT = [int( settings['-CFG_TERMINAL_FONT-'] ), 9][settings=={}]
-        self.XREF_FONT = [int( settings['-CFG_XREF_FONT-'] ), 6][settings=={}]
-        self.CONDUCTOR_FONT = [int( settings['-CFG_CONDUCTOR_FONT-'] ), 6][settings=={}]
+        self.SPLIT_SIZE = int(settings.get('-CFG_SPLIT-', 30))
 
-        self.SPLIT_SIZE = [int( settings['-CFG_SPLIT-'] ), 30][settings=={}]
+        # halves used to center the parts. Integer if possible
+        self.HEAD_HEIGHT_HALF = _half(self.HEAD_HEIGHT)
+        self.HEAD_WIDTH_HALF = _half(self.HEAD_WIDTH)
+        self.UNION_HEIGHT_HALF = _half(self.UNION_HEIGHT)
+        self.TERMINAL_HEIGHT_HALF = _half(self.TERMINAL_HEIGHT)
+        self.TERMINAL_WIDTH_HALF = _half(self.TERMINAL_WIDTH)
 
 
 
@@ -75,11 +141,8 @@ class TerminalBlock:
         return 9999. Usefull for sort reasons.
         e.g. '12-B8' """
 
-        foo = x.split('-')[0]
-        if foo.isdigit():
-            return int(foo)
-        else:
-            return 9999
+        foo = x.partition('-')[0]
+        return int(foo) if foo.isdigit() else 9999
 
 
     def _get_empty_terminal(self, terminal_name=''):
@@ -120,6 +183,52 @@ class TerminalBlock:
                     self.terminals.append( self._get_empty_terminal(i))
 
 
+    def _get_hose_groups(self):
+        """Returns the hoses of the terminal block. Consecutive terminals
+        with the same hose belongs to the same group.
+
+        @return: list of tuples (hose, index of first term, index of last term)
+        """
+        groups = []
+        first = 0
+        for hose, terms in groupby(self.t_hose):
+            last = first + sum(1 for _ in terms) - 1
+            if hose != '':
+                groups.append((hose, first, last))
+            first = last + 1
+        return groups
+
+
+    def _get_terminals_x(self, x_start):
+        """Returns the x coords of all the terminals, computed in one go
+        before drawing anything.
+
+        @param x_start: x coord of the left side of the first terminal
+        @return: tuple (list of left sides, list of centers)
+        """
+        tw = self.TERMINAL_WIDTH
+        x_half = self.TERMINAL_WIDTH_HALF
+        x_lefts = [x_start + i * tw for i in range(self.num_terminals)]
+        x_centers = [x + x_half for x in x_lefts]
+        return x_lefts, x_centers
+
+
+    def _cache_key(self):
+        """Returns a key that identifies the drawing of this terminal block:
+        the names, the content of every terminal and the settings."""
+        return (self.tb_block_name, self.tb_id, \
+                tuple(self.t_name), tuple(self.t_xref), tuple(self.t_type), \
+                tuple(self.t_cable), tuple(self.t_hose), \
+                tuple(self.t_conductor), tuple(self.t_bridge), \
+                self.HEAD_HEIGHT, self.HEAD_WIDTH, \
+                self.UNION_HEIGHT, self.UNION_WIDTH, \
+                self.TERMINAL_HEIGHT, self.TERMINAL_WIDTH, \
+                self.CONDUCTOR_LENGTH, self.HOSE_CONDUCTOR_START, \
+                self.HOSE_LENGTH, self.HOSE_CONDUCTOR_END, \
+                self.HEAD_FONT, self.TERMINAL_FONT, \
+                self.XREF_FONT, self.CONDUCTOR_FONT)
+
+
     def drawTerminalBlock(self):
         """
         Creates a XML node of the terminal block.
@@ -128,256 +237,235 @@ class TerminalBlock:
         @(param) self.terminals
         @return: none"""
 
+        # same terminals and settings than a previous block: reuse it
+        key = self._cache_key()
+        cached = _TB_CACHE.get(key)
+        if cached is not None:
+            _TB_CACHE.move_to_end(key)
+            return etree.fromstring(cached)
+
+        # local copies of the sizes. Used many times in the loop.
+        CL = self.CONDUCTOR_LENGTH
+        TH = self.TERMINAL_HEIGHT
+        TH_HALF = self.TERMINAL_HEIGHT_HALF
+        HCS = self.HOSE_CONDUCTOR_START
+        HL = self.HOSE_LENGTH
+        TW = self.TERMINAL_WIDTH
+        CF = self.CONDUCTOR_FONT
+        YOFF = TerminalBlock.Y_OFFSET_BASE_TEXT
+        XOFF = TerminalBlock.X_OFFSET_CABLE_TEXT
+        Y_HOSE_START = CL + TH + HCS  # y coord where the hose begins
+        Y_HOSE_END = Y_HOSE_START + HL
+        Y_HOSE_BOTTOM = Y_HOSE_END + self.HOSE_CONDUCTOR_END
+
+        # uuids of the element and the texts. At most 7 texts per terminal
+        uuids = iter(['{' + str(uuid4()) + '}' \
+                for _ in range(7 * self.num_terminals + 3)])
+
         # calc some values    
         name = 'TB_'+ self.tb_block_name  
         total_width = self.HEAD_WIDTH + \
                 self.UNION_WIDTH + \
-                self.num_terminals * self.TERMINAL_WIDTH + \
-                1  # +1 to force round the next tenth
-        while (total_width % 10): total_width += 1
-        total_height = self.CONDUCTOR_LENGTH + \
-                self.TERMINAL_HEIGHT + \
-                self.HOSE_CONDUCTOR_START + \
-                self.HOSE_LENGTH + \
-                self.HOSE_CONDUCTOR_END + \
+                self.num_terminals * TW + \
                 1  # +1 to force round the next tenth
-        while (total_height % 10): total_height += 1
+        total_width = (total_width + 9) // 10 * 10
+        total_height = Y_HOSE_BOTTOM + 1  # +1 to force round the next tenth
+        total_height = (total_height + 9) // 10 * 10
 
         # define the element
         """Save the array 'data' to the XML file"""
         cursor = 0  #saves current X coord.
-        root = etree.Element('element', name=name + '.elmt')
+        root = etree.Element('element', attrib={'name': name + '.elmt'})
         
         definition = etree.SubElement(root, "definition", \
+                attrib=DEFINITION_ATTRIB, \
                 height = str(total_height) , \
-                width = str(total_width), \
-                hotspot_x = '5', hotspot_y = '24', \
-                link_type = 'simple', \
-                orientation = 'dyyy' ,\
-                version = '0.4', \
-                type='element')
-        self._element_definitions(definition, name)
-        self._element_label(definition)
+                width = str(total_width))
+        self._element_definitions(definition, name, next(uuids))
+        self._element_label(definition, next(uuids))
         
         informations = etree.SubElement(definition, 'informations')
         informations.text = 'Terminal block'
 
-        description = etree.SubElement(definition, 'description')
+        description = []  # xml fragments of the description. See LINE_TMPL,...
         
         # Geometric y coord of the terminals
-        y_term_center = self.CONDUCTOR_LENGTH + (self.TERMINAL_HEIGHT / 2)
+        y_term_center = CL + TH_HALF
 
         # draw TB header
-        y1 = y_term_center - (self.HEAD_HEIGHT / 2)  # upper left corner
+        y1 = y_term_center - self.HEAD_HEIGHT_HALF  # upper left corner
         hd = self._rect (description, x=cursor, y=y1, \
                 width=self.HEAD_WIDTH, height=self.HEAD_HEIGHT)
         hd_label = self._label_header(description, y=y_term_center, \
-            text=self.tb_block_name)
+            text=self.tb_block_name, uuid=next(uuids))
         
         # draw Union
         cursor += self.HEAD_WIDTH
-        y1 = y_term_center - (self.UNION_HEIGHT / 2)  # upper left corner
+        y1 = y_term_center - self.UNION_HEIGHT_HALF  # upper left corner
         un = self._rect (description, x=cursor, y=y1, \
                 width=self.UNION_WIDTH, height=self.UNION_HEIGHT)
                 
         # process every teminal
         cursor += self.UNION_WIDTH
-        last_trmnl = {}  
-        for k in self.terminals[0]: last_trmnl[k] = ''  # init last_trmnl
-        last_cable_coord_x = cursor
-        max_cond_name_length = max( [len(x['cable']) for x in self.terminals] )
-        max_hose_cond_name_length = max( [len(x['cable']) for x in self.terminals] )
+        x_lefts, x_centers = self._get_terminals_x(cursor)
+        max_cond_name_length = max(len(x) for x in self.t_cable)
          # to align bottom cable labels because of the text goes to north direction.
 
+        # loop invariant coords
+        y_term_top = y_term_center - TH_HALF
+        y_term_label = y_term_center + TH_HALF - YOFF
+        y_xref_label = y_term_center - YOFF
+        y_north_label = CL - YOFF + 3
+        y_south_label = CL + TH + YOFF + (max_cond_name_length * CF)
+        y_south_end_label = Y_HOSE_END + YOFF + \
+                (max_cond_name_length * CF * 1.5)
+        y_south_bottom = CL + TH + CL
+        x_label_offset = CF + XOFF
         
-        for i in range(0, self.num_terminals):
-            trmnl = self.terminals[i]
-            x_term_center = cursor + (self.TERMINAL_WIDTH / 2)
+        for cursor, x_term_center, term_name, term_xref, term_type, \
+                cable, hose, conductor, bridge in zip(x_lefts, x_centers, \
+                self.t_name, self.t_xref, self.t_type, self.t_cable, \
+                self.t_hose, self.t_conductor, self.t_bridge):
             
             # draw terminal
             term = self._rect(description, x=cursor, \
-                    y=y_term_center - (self.TERMINAL_HEIGHT /2 ), \
-                    width= self.TERMINAL_WIDTH, height= self.TERMINAL_HEIGHT)
+                    y=y_term_top, width=TW, height=TH)
             term_label = self._label_term(description, \
-                    x=x_term_center, \
-                    y=y_term_center + (self.TERMINAL_HEIGHT / 2) - TerminalBlock.Y_OFFSET_BASE_TEXT, \
-                    text=trmnl['terminal_name'])
+                    x=x_term_center, y=y_term_label, \
+                    text=term_name, uuid=next(uuids))
             term_xref_label = self._label_term_xref(description, \
-                    x=x_term_center, \
-                    y=y_term_center - TerminalBlock.Y_OFFSET_BASE_TEXT, \
-                    text=trmnl['terminal_xref'])
+                    x=x_term_center, y=y_xref_label, \
+                    text=term_xref, uuid=next(uuids))
             
             # draw fuse, ground,... logo
             logo = self._type_term(description, \
                     x=x_term_center, \
-                    y=y_term_center, typ=trmnl['terminal_type'])
+                    y=y_term_center, typ=term_type)
 
             # draw bridge if needed
-            if trmnl['bridge']:
-                bridge = self._line(description, x1=x_term_center, \
-                        x2=x_term_center + self.TERMINAL_WIDTH , \
+            if bridge:
+                self._line(description, x1=x_term_center, \
+                        x2=x_term_center + TW, \
                         y1=y_term_center, y2=y_term_center)
             
             # draw north cables
             north_cable = self._line(description, x1=x_term_center, x2=x_term_center, \
-                    y1 = 0, y2 = self.CONDUCTOR_LENGTH)
+                    y1 = 0, y2 = CL)
             north_cable_label = self._label_cond(description, \
-                    x=x_term_center - self.CONDUCTOR_FONT - TerminalBlock.X_OFFSET_CABLE_TEXT, \
-                    y=self.CONDUCTOR_LENGTH - TerminalBlock.Y_OFFSET_BASE_TEXT + 3, \
-                    text=trmnl['cable'])
+                    x=x_term_center - x_label_offset, \
+                    y=y_north_label, \
+                    text=cable, uuid=next(uuids))
             north_terminal = self._qet_term(description, x=cursor, y=0, orientation='n')
 
 
             # draw south conductor depens if belongs or not a cable.
-            if trmnl['hose'] != '':  # belongs
+            if hose != '':  # belongs
                 
                 # hose conductor start part
                 south_cable = self._line (description, x1=x_term_center, x2=x_term_center, \
-                    y1 = self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT, \
-                    y2 = self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START)
+                    y1 = CL + TH, y2 = Y_HOSE_START)
                 south_cable_label = self._label_cond(description , \
-                    x=x_term_center - self.CONDUCTOR_FONT - TerminalBlock.X_OFFSET_CABLE_TEXT, \
-                    y=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + TerminalBlock.Y_OFFSET_BASE_TEXT + (max_cond_name_length * self.CONDUCTOR_FONT), \
-                    text=trmnl['cable'])
+                    x=x_term_center - x_label_offset, \
+                    y=y_south_label, \
+                    text=cable, uuid=next(uuids))
                 conductor_label = self._label_cond(description , \
-                    x=x_term_center - self.CONDUCTOR_FONT - TerminalBlock.X_OFFSET_CABLE_TEXT, \
-                    y=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START, \
-                    text=trmnl['conductor'])
+                    x=x_term_center - x_label_offset, \
+                    y=Y_HOSE_START, \
+                    text=conductor, uuid=next(uuids))
                 conductor_tick = self._line(description, \
-                    x1=cursor + self.TERMINAL_WIDTH/2 - 2, \
-                    x2=cursor + self.TERMINAL_WIDTH/2 + 2, \
-                    y1=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START-10 - 2, \
-                    y2=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START-10 + 2)
+                    x1=x_term_center - 2, x2=x_term_center + 2, \
+                    y1=Y_HOSE_START - 10 - 2, y2=Y_HOSE_START - 10 + 2)
 
                 # hose conductor end part
-                y1 = self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START + self.HOSE_LENGTH
-                y2 = y1 + self.HOSE_CONDUCTOR_END
                 south_cable_end = self._line (description, x1=x_term_center, x2=x_term_center, \
-                    y1=y1, y2=y2
+                    y1=Y_HOSE_END, y2=Y_HOSE_BOTTOM
                 ) 
                 south_cable_end_label = self._label_cond(description , \
-                    x=x_term_center - self.CONDUCTOR_FONT - TerminalBlock.X_OFFSET_CABLE_TEXT, \
-                    y=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START + \
-                        self.HOSE_LENGTH + TerminalBlock.Y_OFFSET_BASE_TEXT + (max_hose_cond_name_length * self.CONDUCTOR_FONT*1.5), \
-                    text=trmnl['conductor']
+                    x=x_term_center - x_label_offset, \
+                    y=y_south_end_label, \
+                    text=conductor, uuid=next(uuids)
                 )    
                 conductor_tick_end = self._line(description, \
-                    x1=cursor + self.TERMINAL_WIDTH/2 - 2, \
-                    x2=cursor + self.TERMINAL_WIDTH/2 + 2, \
-                    y1=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START + \
-                        self.HOSE_LENGTH + TerminalBlock.Y_OFFSET_BASE_TEXT + (max_hose_cond_name_length * self.CONDUCTOR_FONT*1.5)-10 -2, \
-                    y2=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START + \
-                        self.HOSE_LENGTH + TerminalBlock.Y_OFFSET_BASE_TEXT + (max_hose_cond_name_length * self.CONDUCTOR_FONT*1.5)-10 +2
+                    x1=x_term_center - 2, x2=x_term_center + 2, \
+                    y1=y_south_end_label - 10 - 2, \
+                    y2=y_south_end_label - 10 + 2
                 )
-                south_terminal = self._qet_term(description, cursor, y2, 's')
+                south_terminal = self._qet_term(description, cursor, Y_HOSE_BOTTOM, 's')
             
 
             else:  # independend conductor (no hose)
                 south_cable = self._line (description, x1=x_term_center, x2=x_term_center, \
-                        y1 = self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT,
-                        y2 = self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.CONDUCTOR_LENGTH)
+                        y1 = CL + TH, y2 = y_south_bottom)
                 south_cable_label = self._label_cond(description , \
-                    x=x_term_center - self.CONDUCTOR_FONT - 3, \
-                    y=self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + TerminalBlock.Y_OFFSET_BASE_TEXT + (max_cond_name_length * self.CONDUCTOR_FONT), \
-                    text=trmnl['cable'])
+                    x=x_term_center - CF - 3, \
+                    y=y_south_label, \
+                    text=cable, uuid=next(uuids))
                 south_terminal = self._qet_term(description, x=cursor, \
-                    y=2*self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT , orientation='s')
-
-            # draw horizontal line across all hose conductors when end of hose is detected
-            y1 = self.CONDUCTOR_LENGTH + self.TERMINAL_HEIGHT + self.HOSE_CONDUCTOR_START
-            y2 = y1 + self.HOSE_LENGTH
-            if ( (trmnl['hose'] != last_trmnl['hose']) and (last_trmnl['hose'] != '') ) \
-                or \
-               ( (last_trmnl['hose'] != '') and (i == self.num_terminals - 1) ):  # hose change or the hose arrives to the last term
-                    
-                x1 = last_cable_coord_x + (self.TERMINAL_WIDTH / 2)
-                x2 = cursor - (self.TERMINAL_WIDTH / 2)
-                
-                # Change coord for horizontal line    
-                if i == self.num_terminals - 1:
-                    if trmnl['hose'] == last_trmnl['hose']:
-                        x2 = x2 + self.TERMINAL_WIDTH 
-
-                hor_line1 = self._line(description, x1, x2, y1, y1)
-                hor_line2 = self._line(description, x1, x2, y2, y2)
-                ver_line = self._line(description, (x1+x2)/2, (x1+x2)/2, y1, y2)
-                ver_line_label = self._label_cond(description, \
-                        (x1+x2)/2 - self.TERMINAL_WIDTH + 10, \
-                        y1 + ((y2-y1)/2) + len(last_trmnl['hose'])*1.3, \
-                        last_trmnl['hose'])
-                 
-
-            # Last terminal belongs to a individual hose
-            if ( (last_trmnl['hose'] == '') and trmnl['hose'] !='' and (i == self.num_terminals - 1) ):  
-                
-                x1 = cursor  + (self.TERMINAL_WIDTH / 2)
-                ver_line = self._line(description, x1, x1, y1, y2)
-                ver_line_label = self._label_cond(description, \
-                x1 - 10, \
-                y1 + ((y2-y1)/2) + len(trmnl['hose'])*1.3, \
-                trmnl['hose'])                   
-
-                        
-            # memo of x coord.
-            if trmnl['hose'] != last_trmnl['hose']:
-                last_cable_coord_x = cursor
-
-                
-            # task at loop end
-            cursor += self.TERMINAL_WIDTH
-            last_trmnl = trmnl
-
-
+                    y=y_south_bottom, orientation='s')
+
+
+        # draw horizontal line across all hose conductors of every hose
+        y1 = Y_HOSE_START
+        y2 = Y_HOSE_END
+        y_hose_label = y1 + _half(HL)
+        hose_lines = []  # (x1, x2, y1, y2) of all hoses. Drawn at once
+        for hose, first, last in self._get_hose_groups():
+            x1 = x_centers[first]
+            x2 = x_centers[last]
+
+            if first == last == self.num_terminals - 1:
+                # Last terminal belongs to a individual hose
+                xm = x2
+                x_label = x2 - 10
+            else:
+                xm = _half(x1 + x2)
+                x_label = xm - TW + 10
+                hose_lines.append((x1, x2, y1, y1))
+                hose_lines.append((x1, x2, y2, y2))
+            hose_lines.append((xm, xm, y1, y2))
+            ver_line_label = self._label_cond(description, \
+                    x_label, \
+                    y_hose_label + len(hose)*1.3, \
+                    hose, next(uuids))
+        self._lines_batch(description, hose_lines)
+
+
+        definition.append(etree.fromstring( \
+                '<description>{}</description>'.format(''.join(description))))
+
+        _TB_CACHE[key] = etree.tostring(root)
+        if len(_TB_CACHE) > _TB_CACHE_SIZE:
+            _TB_CACHE.popitem(last=False)  # the least recently used
 
         #~ etree.ElementTree(root).write('tmp.xml') #, pretty_print=True)
         return root
 
 
-    def _element_definitions(self, father, name):
-        sUUID = '{' + uuidly.uuid1().urn[9:] + '}'
-        uuid = etree.SubElement(father, 'uuid', uuid=sUUID)
+    def _element_definitions(self, father, name, uuid):
+        etree.SubElement(father, 'uuid', attrib={'uuid': uuid})
         
-        names = etree.SubElement(father, 'names')
-        lang1 = etree.SubElement(names, 'name', lang='de')
-        lang1.text = 'Terminalblock ' + name
-        lang2 = etree.SubElement(names, 'name', lang='ru')
-        lang2.text = '&#x422;&#x435;&#x440;&#x43C;&#x438;&#x43D;&#x430;&#x43B;&#x44C;&#x43D;&#x44B;&#x439; &#x431;&#x43B;&#x43E;&#x43A; ' + name
-        lang3 = etree.SubElement(names, 'name', lang='pt')
-        lang3.text = 'Bloco terminal ' + name
-        lang4 = etree.SubElement(names, 'name', lang='en')
-        lang4.text = 'Terminal block ' + name
-        lang5 = etree.SubElement(names, 'name', lang='it')
-        lang5.text = 'Terminal block ' + name
-        lang6 = etree.SubElement(names, 'name', lang='fr')
-        lang6.text = 'Bornier ' + name
-        lang7 = etree.SubElement(names, 'name', lang='pl')
-        lang7.text = 'Blok zacisk&#xF3;w ' + name
-        lang8 = etree.SubElement(names, 'name', lang='es')
-        lang8.text = 'Bornero ' + name
-        lang9 = etree.SubElement(names, 'name', lang='nl')
-        lang9.text = 'Eindblok ' + name
-        lang10 = etree.SubElement(names, 'name', lang='cs')
-        lang10.text = 'Termin&#xE1;lov&#xFD; blok ' + name
-
-
-    def _element_label(self, father):
+        father.append(etree.fromstring(NAMES_TMPL.format(''.join( \
+                [NAME_TMPL.format(lang=lang, text=escape(text + name)) \
+                for lang, text in ELEMENT_NAMES]))))
+
+
+    def _element_label(self, father, uuid):
         # element label
         label = etree.SubElement(father, 'dynamic_text', \
+                attrib=ELEMENT_LABEL_ATTRIB, \
                 x=str(self.HEAD_WIDTH + 5), \
                 y=str(self.HEAD_HEIGHT + 5), \
-                z='2', \
-                text_from='ElementInfo', text_width='-1', \
-                uuid = '{' + uuidly.uuid1().urn[9:] + '}', \
-                font_size='10', frame='false')
+                uuid=uuid)
         label_text = etree.SubElement(label, 'text')
         label_text.text = self.tb_id
         label_info = etree.SubElement(label, 'info_name')
         label_info.text = 'label'
 
 
-    def _type_term(self, father, x, y, typ):
+    def _type_term(self, buf, x, y, typ):
         """
-        Generates a xml element that represents the logo of the teminal
+        Generates the xml of the logo of the teminal
+        @param buf: list of xml fragments of the description
         @param x: center of terminal
         @param y: center of terminal
         """
@@ -385,188 +473,142 @@ class TerminalBlock:
             logo_with = 15
             y1 = y - 10
             y2 = y
-            vert_line1 = self._line(father, x, x, y1, y2)
-                        
-            x1 = x - (logo_with / 2)
-            x2 = x + (logo_with / 2)
-            hor_line1 = self._line(father, x1, x2, y2, y2)
-            hor_line2 = self._line(father, x1+2, x2-2, y2+2, y2+2)
-            hor_line3 = self._line(father, x1+4, x2-4, y2+4, y2+4)
-            hor_line4 = self._line(father, x1+6, x2-6, y2+6, y2+6)
+            x1 = x - _half(logo_with)
+            x2 = x + _half(logo_with)
+            self._lines_batch(buf, ( \
+                    (x, x, y1, y2), \
+                    (x1, x2, y2, y2), \
+                    (x1+2, x2-2, y2+2, y2+2), \
+                    (x1+4, x2-4, y2+4, y2+4), \
+                    (x1+6, x2-6, y2+6, y2+6)))
         
         elif typ.lower() == 'fuse':
-            logo_height = TerminalBlock.LOGO_HEIGHT
-            x1 = x - (self.TERMINAL_WIDTH / 2)
-            x2 = x + (self.TERMINAL_WIDTH / 2)
-            y1 = y - (logo_height/2)
-            y2 = y + (logo_height/2)
-            hor_line1 = self._line(father, x1, x2, y1, y1)
-            hor_line2 = self._line(father, x1, x2, y2, y2)
+            x1 = x - self.TERMINAL_WIDTH_HALF
+            x2 = x + self.TERMINAL_WIDTH_HALF
+            y1 = y - TerminalBlock.LOGO_HEIGHT_HALF
+            y2 = y + TerminalBlock.LOGO_HEIGHT_HALF
             
             # central square
             x1a = x - 3
             x2a = x + 3
             y1a = y1 + 6
             y2a = y2 - 6
-            hor_line3 = self._line(father, x1a, x2a, y1a, y1a)
-            hor_line4 = self._line(father, x1a, x2a, y2a, y2a)
-            vert_line1 = self._line(father, x1a, x1a, y1a, y2a)
-            vert_line2 = self._line(father, x2a, x2a, y1a, y2a)
-            vert_line3 = self._line(father, x1a + (x2a-x1a)/2, \
-                    x1a + (x2a-x1a)/2, y1a-3, y2a+3)
+            xca = x1a + _half(x2a-x1a)
+            self._lines_batch(buf, ( \
+                    (x1, x2, y1, y1), \
+                    (x1, x2, y2, y2), \
+                    (x1a, x2a, y1a, y1a), \
+                    (x1a, x2a, y2a, y2a), \
+                    (x1a, x1a, y1a, y2a), \
+                    (x2a, x2a, y1a, y2a), \
+                    (xca, xca, y1a-3, y2a+3)))
         else: 
-            cir = self._circle(father, x-2, y-2, 4)
+            cir = self._circle(buf, x-2, y-2, 4)
             
                         
-    def _circle(self, father, x, y, diameter):
+    def _circle(self, buf, x, y, diameter):
         """Generates a xml element that represents a line verticalcentered 
         on the terminal
         """
-        ls = 'line-style:normal;line-weight:normal;filling:none;color:black'
-        return etree.SubElement(father, 'circle', \
-                        x = str(x), y = str(y), diameter = str(diameter), \
-                        antialias = 'false', \
-                        style = ls)
+        buf.append(CIRCLE_TMPL.format(x=x, y=y, diameter=diameter, \
+                style=STROKE_STYLE))
 
 
-    def _line(self, father, x1, x2, y1, y2):
+    def _line(self, buf, x1, x2, y1, y2):
         """Generates a xml element that represents a line  
         on the terminal
         """
-        ls = 'line-style:normal;line-weight:normal;filling:none;color:black'
-        return etree.SubElement(father, 'line', \
-                        x1 = str(x1), \
-                        x2 = str(x2), \
-                        y1 = str(y1), \
-                        y2 = str(y2), \
-                        length1 = '1.5', \
-                        length2 = '1.5', \
-                        end1 = 'none', \
-                        end2 = 'none', \
-                        antialias = 'false', \
-                        style = ls)
-
-
-    def _rect(self, father, x, y, width, height):
+        buf.append(LINE_TMPL.format(x1=x1, x2=x2, y1=y1, y2=y2, \
+                style=STROKE_STYLE))
+
+
+    def _lines_batch(self, buf, coords):
+        """Generates the xml of several lines at once
+        @param buf: list of xml fragments of the description
+        @param coords: iterable of (x1, x2, y1, y2)
+        """
+        buf.append(''.join([LINE_TMPL.format(x1=x1, x2=x2, y1=y1, y2=y2, \
+                style=STROKE_STYLE) for x1, x2, y1, y2 in coords]))
+
+
+    def _rect(self, buf, x, y, width, height):
         """Generates a xml element that represents a line vertical centered 
         on the terminal
         """
-        style = 'line-style:normal;line-weight:normal;filling:none;color:black'
-        return etree.SubElement(father, 'rect', \
-                    x = str(x), \
-                    y = str(y), \
-                    width = str(width), \
-                    height = str(height), \
-                    antialias = 'false', \
-                    style = style)
+        buf.append(RECT_TMPL.format(x=x, y=y, width=width, height=height, \
+                style=STROKE_STYLE))
 
 
-    def _qet_term(self, father, x, y, orientation):
+    def _qet_term(self, buf, x, y, orientation):
         """Generates a xml element that represents a line verticalcentered 
         on the terminal
         """
-        xc = x + self.TERMINAL_WIDTH / 2
-        orth_terminal = etree.SubElement(father, 'terminal', \
-                    x=str(xc), y=str(y), \
-                    orientation=orientation)
+        xc = x + self.TERMINAL_WIDTH_HALF
+        buf.append(TERMINAL_TMPL.format(x=xc, y=y, orientation=orientation))
 
 
-    def _label_cond(self, father, x, y, text):
+    def _label_cond(self, buf, x, y, text, uuid):
         """Generates a xml element that represents a label of a conductor centered
         on the terminal
-        @ param father: xml node father
+        @ param buf: list of xml fragments of the description
         @ param x: x pos. of terminal
         @ param y: y pos. of the text
         @ param text: text to show
+        @ param uuid: uuid of the text, e.g. '{...}'
         """
         size = self.CONDUCTOR_FONT
         xc = x - size + 1
-        label = etree.SubElement(father, 'dynamic_text', \
-                x=str(xc), \
-                y=str(y), \
-                z='3', \
-                text_from='UserText', \
-                uuid = '{' + uuidly.uuid1().urn[9:] + '}', \
-                font_size=str(size), frame='false', \
-                rotation='270')
-        label_text = etree.SubElement(label, 'text')
-        label_text.text = text
-        #label_color = etree.SubElement(label, 'color')
-        #label_color.text = '#ff0000'  
-        return label          
+        buf.append(DYNAMIC_TEXT_TMPL.format(x=xc, y=y, \
+                uuid=uuid, \
+                size=size, text=escape(text), color=''))
+        #label_color: COLOR_TMPL.format('#ff0000')
         
 
-    def _label_header(self, father, y, text):
+    def _label_header(self, buf, y, text, uuid):
         """Generates a xml element that represents a label of a conductor centered
         on the terminal. 
-        @ param father: xml node father
+        @ param buf: list of xml fragments of the description
         @ param y: y pos. of the center header
         @ param text: text to show
+        @ param uuid: uuid of the text, e.g. '{...}'
         """
         size = self.HEAD_FONT
-        x = (self.HEAD_WIDTH / 2) - size
+        x = self.HEAD_WIDTH_HALF - size
         y = y + (len(text) / 2) * size
-        label = etree.SubElement(father, 'dynamic_text', \
-                x=str(x), \
-                y=str(y), \
-                z='3', \
-                text_from='UserText', \
-                uuid = '{' + uuidly.uuid1().urn[9:] + '}', \
-                font_size=str(size), frame='false', \
-                rotation='270')
-        label_text = etree.SubElement(label, 'text')
-        label_text.text = text
-        label_color = etree.SubElement(label, 'color')
-        label_color.text = '#777777'
-        return label
+        buf.append(DYNAMIC_TEXT_TMPL.format(x=x, y=y, \
+                uuid=uuid, \
+                size=size, text=escape(text), color=COLOR_TMPL.format('#777777')))
 
 
-    def _label_term(self, father, x, y, text):
+    def _label_term(self, buf, x, y, text, uuid):
         """Generates a xml element that represents a label of a conductor centered
         on the terminal
-        @ param father: xml node father
+        @ param buf: list of xml fragments of the description
         @ param x: x pos. of the terminal
         @ param y: y pos. of the bottom of the terminal
         @ param text: id of the terminal
+        @ param uuid: uuid of the text, e.g. '{...}'
         """
         size = self.TERMINAL_FONT
         x1 = x - (size * 1.1)
         y1 = y + (y*0.10)
-        label = etree.SubElement(father, 'dynamic_text', \
-                x=str(x1), \
-                y=str(y1), \
-                z='3', \
-                text_from='UserText', \
-                uuid = '{' + uuidly.uuid1().urn[9:] + '}', \
-                font_size=str(size), frame='false', \
-                rotation='270')
-        label_text = etree.SubElement(label, 'text')
-        label_text.text = text
-        label_color = etree.SubElement(label, 'color')
-        label_color.text = '#555555'
-        return label
+        buf.append(DYNAMIC_TEXT_TMPL.format(x=x1, y=y1, \
+                uuid=uuid, \
+                size=size, text=escape(text), color=COLOR_TMPL.format('#555555')))
 
 
-    def _label_term_xref(self, father, x, y, text):
+    def _label_term_xref(self, buf, x, y, text, uuid):
         """Generates a xml element that represents a label of a conductor centered
         on the terminal
-        @ param father: xml node father
+        @ param buf: list of xml fragments of the description
         @ param x: x pos. of the terminal
         @ param y: y pos. of the top part of the possible logo (fuse, ground,...)
         @ param text: id of the terminal
+        @ param uuid: uuid of the text, e.g. '{...}'
         """
         size = self.XREF_FONT
         x1 = x - (size * 1.1)
-        label = etree.SubElement(father, 'dynamic_text', \
-                x=str(x1), \
-                y=str(y), \
-                z='3', \
-                text_from='UserText', \
-                uuid = '{' + uuidly.uuid1().urn[9:] + '}', \
-                font_size=str(size), frame='false', \
-                rotation='270')
-        label_text = etree.SubElement(label, 'text')
-        label_text.text = text
-        #label_color = etree.SubElement(label, 'color')
-        #label_color.text = '#ff0000'  
-        return label          
\ No newline at end of file
+        buf.append(DYNAMIC_TEXT_TMPL.format(x=x1, y=y, \
+                uuid=uuid, \
+                size=size, text=escape(text), color=''))
+        #label_color: COLOR_TMPL.format('#ff0000')
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# Run from the root of the repository: python -m unittest discover tests
+
+import unittest
+from lxml import etree
+
+from src.qetproject import QETProject
+
+
+def _terminal(function, name=''):
+    """Returns a terminal element with the given function and label infos"""
+    return etree.fromstring('<element type="embed://import/borne_continuite.elmt" ' \
+            'uuid="{{0}}"><elementInformations>' \
+            '<elementInformation name="label">{}</elementInformation>' \
+            '<elementInformation name="function">{}</elementInformation>' \
+            '</elementInformations></element>'.format(name, function))
+
+
+class ElementMetadataTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.project = QETProject('sample_projects/sample_1.qet')
+
+    def test_digit_keys(self):
+        meta = self.project._getElementMetadata(_terminal('%p\u00b2%p7'))
+        self.assertEqual(meta['terminal_pos'], '7')
+        meta = self.project._getElementMetadata(_terminal('%s910nx%s9'))
+        self.assertEqual(meta['size'], '9')
+        meta = self.project._getElementMetadata(_terminal('%r%r2'))
+        self.assertEqual(meta['num_reserve'], '2')
+        # the old regexes accepted a final newline after the digits
+        meta = self.project._getElementMetadata(_terminal('%p3\n'))
+        self.assertEqual(meta['terminal_pos'], '3')
+        meta = self.project._getElementMetadata(_terminal('%r2\n'))
+        self.assertEqual(meta['num_reserve'], '2')
+        meta = self.project._getElementMetadata(_terminal('%s9\n'))
+        self.assertEqual(meta['size'], '9')
+        meta = self.project._getElementMetadata(_terminal('%p3\n%tFUSE'))
+        self.assertEqual(meta['terminal_pos'], '')
+
+    def test_text_without_keys(self):
+        for text in ('hot wire', 'bridge', 'neutral', 'terminal'):
+            meta = self.project._getElementMetadata(_terminal(text))
+            self.assertEqual(meta['hose'], '')
+            self.assertEqual(meta['bridge'], '')
+            self.assertEqual(meta['conductor'], '')
+            self.assertEqual(meta['terminal_type'], 'STANDARD')
+
+    def test_text_before_keys(self):
+        meta = self.project._getElementMetadata(_terminal('hot%hW1%n3'))
+        self.assertEqual(meta['hose'], 'W1')
+        self.assertEqual(meta['conductor'], '3')
+        self.assertEqual(meta['terminal_pos'], '')
+
+    def test_invalid_terminal_names(self):
+        valid = self.project._isValidTerminal
+        self.assertTrue(valid(_terminal('', 'X1:1')))
+        self.assertFalse(valid(_terminal('', 'X1:')))
+        self.assertFalse(valid(_terminal('', 'X1\n:1')))
+
+
+if __name__ == '__main__':
+    unittest.main()